@@ -1,14 +1,20 @@
 #!/usr/bin/env python
 
 import argparse
+import base64
+import bisect
+import contextlib
+import hashlib
 import json
 import os
 import shutil
+import socket
 import subprocess
+import threading
 import types
-import urllib.request
-import tempfile
+import urllib.parse
 
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from pathlib import Path
 
 
@@ -21,9 +27,22 @@ PATH_VENUS = "venus-5.2"
 PATH_WDSFR = "Windows/System32/DriverStore/FileRepository"
 PATH_THIRDPARTY = Path(__file__).parent / 'third-party'
 
+TOOL_PIL_SPLITTER = PATH_THIRDPARTY / "qcom-mbn-tools" / "pil-splitter.py"
+TOOL_ATH10K_BDENCODER = PATH_THIRDPARTY / "qca-swiss-army-knife" / "tools" / "scripts" / "ath10k" / "ath10k-bdencoder"
+TOOL_ATH10K_FWENCODER = PATH_THIRDPARTY / "qca-swiss-army-knife" / "tools" / "scripts" / "ath10k" / "ath10k-fwencoder"
+
 URL_AARCH64_FIRMWARE_REPO = "https://raw.githubusercontent.com/linux-surface/aarch64-firmware/main/firmware"
 URL_LINUX_FIRMWARE_REPO = "https://git.kernel.org/pub/scm/linux/kernel/git/firmware/linux-firmware.git/plain"
 
+DOWNLOAD_MAX_WORKERS = 16
+DOWNLOAD_MAX_CONNECTIONS_PER_HOST = 8
+DOWNLOAD_MAX_RETRIES = 4
+DOWNLOAD_MAX_REDIRECTS = 5
+DOWNLOAD_BUFSIZE = 1 << 20
+DOWNLOAD_TIMEOUT = 30
+
+COPY_MAX_WORKERS = 8
+
 
 class Logger:
     log_pfx = [
@@ -32,26 +51,53 @@ class Logger:
         "    ",
     ]
 
-    def __init__(self, level=0):
+    lock = threading.Lock()
+
+    def __init__(self, level=0, lines=None):
         self.level = level
         self.pfx = Logger.log_pfx[level]
+        self.lines = lines
 
     def sub(self):
-        return Logger(level=self.level + 1)
+        return Logger(level=self.level + 1, lines=self.lines)
+
+    def buffered(self):
+        """
+        Create a logger on the same level that collects messages until they
+        are explicitly flushed, so that output of concurrent tasks does not
+        get interleaved.
+        """
+        return Logger(level=self.level, lines=[])
+
+    def flush(self):
+        with Logger.lock:
+            for line in self.lines:
+                print(line)
+
+        self.lines.clear()
+
+    def _write(self, line):
+        if self.lines is not None:
+            self.lines.append(line)
+        else:
+            with Logger.lock:
+                print(line)
 
     def info(self, msg):
-        print(f"{self.pfx}{msg}")
+        self._write(f"{self.pfx}{msg}")
 
     def warn(self, msg):
-        print(f"{self.pfx}WARNING: {msg}")
+        self._write(f"{self.pfx}WARNING: {msg}")
 
     def error(self, msg):
-        print(f"{self.pfx}ERROR: {msg}")
+        self._write(f"{self.pfx}ERROR: {msg}")
 
 
 class Firmware:
     """Basic firmware source description"""
 
+    __slots__ = ("name", "target_directory")
+
     @staticmethod
     def _filemap(files):
         if isinstance(files, list):
@@ -65,6 +111,14 @@ class Firmware:
         self.name = name
         self.target_directory = Path(target_directory)
 
+    def _create_target_directories(self, args, files):
+        # Many files share the same parent directory, so create each only once.
+        # Sort by depth so that parents are created before their children.
+        parents = {(args.path_out / self.target_directory / t).parent for t in files}
+
+        for p in sorted(parents, key=lambda p: len(p.parts)):
+            p.mkdir(parents=True, exist_ok=True)
+
     def get(self, log, args):
         raise NotImplementedError()
 
@@ -72,6 +126,8 @@ class Firmware:
 class WindowsDriverFirmware(Firmware):
     """Firmware extracted from Windows Driver Store File Repository"""
 
+    __slots__ = ("source_directory", "files")
+
     def __init__(self, name, target_directory, source_directory, files):
         super().__init__(name, target_directory)
 
@@ -79,44 +135,448 @@ class WindowsDriverFirmware(Firmware):
         self.files = Firmware._filemap(files)
 
     def _find_source_directory(self, args):
-        for p in args.path_wdsfr.iterdir():
-            if p.name.startswith(self.source_directory):
-                return p
+        # The index is sorted, so the first candidate is the first name that
+        # does not compare less than the prefix
+        i = bisect.bisect_left(args.wdsfr_index, self.source_directory)
+
+        if i < len(args.wdsfr_index) and args.wdsfr_index[i].startswith(self.source_directory):
+            return args.path_wdsfr / args.wdsfr_index[i]
 
     def get(self, log, args):
         base = self._find_source_directory(args)
 
+        self._create_target_directories(args, self.files.values())
+
+        futures = []
+
         for s, t in self.files.items():
             src = base / s
             tgt = args.path_out / self.target_directory / t
 
-            tgt.parent.mkdir(parents=True, exist_ok=True)
-
             log.info(f"copying '{src}' to '{self.target_directory / t}'")
-            shutil.copy(src, tgt)
+            futures.append(args.copy_pool.submit(copy, args, src, tgt))
+
+        wait_all(futures)
+
+
+def copy(args, src, tgt):
+    if args.stop.is_set():
+        raise CancelledError()
+
+    shutil.copyfile(src, tgt)
 
 
 class DownloadFirmware(Firmware):
     """Firmware downloaded from the internet"""
 
+    __slots__ = ("source_url", "files")
+
     def __init__(self, name, target_directory, source_url, files):
         super().__init__(name, target_directory)
 
         self.source_url = source_url
         self.files = Firmware._filemap(files)
 
-    def get(self, log, args):
+    def downloads(self, log, args):
+        self._create_target_directories(args, self.files.values())
+
         for s, t in self.files.items():
             src = f"{self.source_url}/{s}"
             tgt = args.path_out / self.target_directory / t
 
-            tgt.parent.mkdir(parents=True, exist_ok=True)
-
             log.info(f"downloading '{src}' to '{self.target_directory / t}'")
-            urllib.request.urlretrieve(src, tgt)
+            yield src, tgt
+
+    def get(self, log, args):
+        download_all(args, self.downloads(log, args))
+
+
+class HttpError(Exception):
+    def __init__(self, url, status, reason):
+        super().__init__(f"HTTP {status} {reason}: '{url}'")
+
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+    def is_transient(self):
+        return self.status >= 500 or self.status == 429
+
+
+class HttpSession:
+    """
+    Minimal HTTP client keeping persistent connections. Connections are kept
+    alive after a request has completed and re-used for subsequent requests to
+    the same host, so that we only pay for the TCP and TLS handshakes once per
+    connection instead of once per file. The number of concurrent connections
+    per host is limited, so that concurrent downloads queue up for an existing
+    connection instead of opening new ones.
+    """
+
+    def __init__(self, stop, timeout=DOWNLOAD_TIMEOUT, max_connections=DOWNLOAD_MAX_CONNECTIONS_PER_HOST):
+        self.stop = stop
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.slots = {}
+
+        # The HTTP stack is only imported here, as http.client pulls in ssl
+        # and email, which is noticeable when e.g. only printing help
+        global http
+        import http.client
+        import urllib.request
+
+        self.getproxies = urllib.request.getproxies
+        self.proxy_bypass = urllib.request.proxy_bypass
+
+    def _proxy(self, scheme, host):
+        """Return the proxy to use for the given host as split URL (or None)"""
+
+        proxy = self.getproxies().get(scheme)
+        if not proxy or self.proxy_bypass(urllib.parse.urlsplit(f"//{host}").hostname):
+            return None
+
+        # Proxies may be specified without scheme (e.g. 'proxy:3128')
+        if "://" not in proxy:
+            proxy = f"http://{proxy}"
+
+        return urllib.parse.urlsplit(proxy)
+
+    def _proxy_headers(self, proxy):
+        if proxy.username is None:
+            return {}
+
+        user = urllib.parse.unquote(proxy.username)
+        password = urllib.parse.unquote(proxy.password or "")
+        token = base64.b64encode(f"{user}:{password}".encode()).decode()
+
+        return {"Proxy-Authorization": f"Basic {token}"}
+
+    def _connect(self, scheme, host):
+        if scheme not in ("https", "http"):
+            raise Exception(f"unsupported URL scheme: '{scheme}'")
+
+        proxy = self._proxy(scheme, host)
+
+        if proxy is None:
+            if scheme == "https":
+                return http.client.HTTPSConnection(host, timeout=self.timeout)
+            else:
+                return http.client.HTTPConnection(host, timeout=self.timeout)
+
+        if scheme == "https":
+            # Tunnel TLS through the proxy via CONNECT
+            conn = http.client.HTTPSConnection(proxy.hostname, proxy.port or 80, timeout=self.timeout)
+            conn.set_tunnel(host, headers=self._proxy_headers(proxy))
+            return conn
+        else:
+            # Plain HTTP requests are sent to the proxy directly, see _request()
+            return http.client.HTTPConnection(proxy.hostname, proxy.port or 80, timeout=self.timeout)
+
+    def _slot(self, key):
+        with self.lock:
+            return self.slots.setdefault(key, threading.BoundedSemaphore(self.max_connections))
+
+    def _acquire(self, key):
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+
+        return self._connect(*key), False
+
+    def _release(self, key, conn, resp):
+        # Responses without body (e.g. to HEAD requests) are only marked as
+        # complete once read, and http.client refuses to send the next request
+        # on a connection before that
+        if resp.length == 0 and not resp.isclosed():
+            resp.read()
+
+        # Only re-use the connection if the response has been read completely.
+        # A remaining length means that the server closed the connection early.
+        if resp.isclosed() and not resp.length and not resp.will_close:
+            with self.lock:
+                self.idle.setdefault(key, []).append(conn)
+        else:
+            conn.close()
+
+        self._slot(key).release()
+
+    def _send(self, conn, method, path, headers):
+        try:
+            conn.request(method, path, headers=headers)
+            return conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    def _request(self, method, url, headers):
+        url = urllib.parse.urlsplit(url)
+        key = (url.scheme, url.netloc)
+        path = urllib.parse.urlunsplit(("", "", url.path or "/", url.query, ""))
+
+        # Plain HTTP proxies expect the absolute URL as request target
+        proxy = self._proxy(*key) if url.scheme == "http" else None
+        if proxy is not None:
+            path = urllib.parse.urlunsplit((url.scheme, url.netloc, url.path or "/", url.query, ""))
+            headers = {**headers, **self._proxy_headers(proxy)}
+
+        # Do not keep waiting for a free connection if we should stop
+        slot = self._slot(key)
+        while not slot.acquire(timeout=0.1):
+            if self.stop.is_set():
+                raise CancelledError()
+
+        try:
+            conn, reused = self._acquire(key)
+
+            try:
+                return key, conn, self._send(conn, method, path, headers)
+            except (http.client.HTTPException, OSError):
+                # The server may have closed an idle connection on its side,
+                # so retry once with a fresh one
+                if not reused:
+                    raise
+
+            conn = self._connect(*key)
+            return key, conn, self._send(conn, method, path, headers)
+
+        except BaseException:
+            slot.release()
+            raise
+
+    @contextlib.contextmanager
+    def request(self, method, url, headers=None):
+        for _ in range(DOWNLOAD_MAX_REDIRECTS + 1):
+            key, conn, resp = self._request(method, url, headers or {})
+
+            location = resp.getheader("Location")
+            if resp.status not in (301, 302, 303, 307, 308) or not location:
+                break
+
+            try:
+                resp.read()
+            except BaseException:
+                conn.close()
+                self._slot(key).release()
+                raise
+
+            self._release(key, conn, resp)
+
+            url = urllib.parse.urljoin(url, location)
+        else:
+            raise Exception(f"too many redirects: '{url}'")
+
+        try:
+            yield resp
+        finally:
+            self._release(key, conn, resp)
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+    @staticmethod
+    def check_complete(resp):
+        """
+        Ensure that the full body of the response has been received. Reading
+        from a response whose connection got closed prematurely just returns
+        EOF, so this has to be checked explicitly after reading.
+        """
+
+        if resp.length:
+            raise http.client.IncompleteRead(b"", resp.length)
+
+    def head(self, url, headers=None):
+        return self.request("HEAD", url, headers)
+
+
+def _exists_with_same_size(args, src, tgt):
+    if not tgt.exists():
+        return False
+
+    with args.http.head(src) as r:
+        size = r.getheader("Content-Length")
+
+        return r.status == 200 and size is not None and int(size) == tgt.stat().st_size
+
+
+def _fetch(args, src, tgt):
+    with args.http.get(src) as r:
+        if r.status != 200:
+            raise HttpError(src, r.status, r.reason)
+
+        with open(tgt, "wb") as fd:
+            shutil.copyfileobj(r, fd, length=DOWNLOAD_BUFSIZE)
+
+        HttpSession.check_complete(r)
+
+
+def _read_metadata(path):
+    """Read a cache metadata file. Missing or corrupt files count as absent."""
+
+    try:
+        info = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    return info if isinstance(info, dict) else None
+
+
+def _write_metadata(path, info):
+    # Write via a temporary file so that an interrupted write cannot leave
+    # a truncated metadata file behind
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_text(json.dumps(info))
+    os.replace(tmp, path)
+
+
+def _range_validator(info):
+    # If-Range requires a strong ETag, fall back to the modification date
+    etag = info.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+
+    return info.get("last_modified")
+
+
+def _fetch_cached(args, src, tgt):
+    """
+    Fetch a file via the download cache. Cached files are re-validated using
+    conditional requests based on the ETag and Last-Modified headers, so that
+    unchanged files do not have to be transferred again. Interrupted downloads
+    are resumed via range requests if the remote file has not changed since.
+    """
+
+    key = hashlib.sha256(src.encode()).hexdigest()
+    data = args.path_cache / f"{key}.bin"
+    meta = args.path_cache / f"{key}.meta.json"
+    part = args.path_cache / f"{key}.part"
+    part_meta = args.path_cache / f"{key}.part.meta.json"
+
+    headers = {}
+    info = _read_metadata(meta) if data.exists() else None
+    if info:
+        if info.get("etag"):
+            headers["If-None-Match"] = info["etag"]
+        if info.get("last_modified"):
+            headers["If-Modified-Since"] = info["last_modified"]
+
+    offset = 0
+    info = _read_metadata(part_meta) if part.exists() else None
+    if info:
+        validator = _range_validator(info)
+
+        if validator:
+            offset = part.stat().st_size
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+    with args.http.get(src, headers) as r:
+        if r.status == 304:
+            r.read()
+            shutil.copyfile(data, tgt)
+            return
+
+        elif r.status == 200:
+            info = {
+                "url": src,
+                "etag": r.getheader("ETag"),
+                "last_modified": r.getheader("Last-Modified"),
+            }
+            _write_metadata(part_meta, info)
+
+            # Write to cache and target in one pass instead of copying the
+            # cached file again afterwards
+            with open(part, "wb") as fd_cache, open(tgt, "wb") as fd_tgt:
+                while chunk := r.read(DOWNLOAD_BUFSIZE):
+                    fd_cache.write(chunk)
+                    fd_tgt.write(chunk)
+
+            # Never move an incomplete file into the cache
+            HttpSession.check_complete(r)
+
+        elif r.status == 206 and (r.getheader("Content-Range") or "").startswith(f"bytes {offset}-"):
+            with open(part, "ab") as fd:
+                shutil.copyfileobj(r, fd, length=DOWNLOAD_BUFSIZE)
+
+            HttpSession.check_complete(r)
+
+            # Content-Range is 'bytes <first>-<last>/<total>', where the total
+            # may be unknown ('*')
+            total = r.getheader("Content-Range").rpartition("/")[2]
+            size = part.stat().st_size
+            if total.isdigit() and size != int(total):
+                # The partial file does not add up, so start over next time
+                part.unlink()
+                part_meta.unlink()
+                raise http.client.IncompleteRead(b"", int(total) - size)
+
+        elif r.status in (206, 416):
+            # The server does not agree with our partial file, so start over
+            part.unlink()
+            part_meta.unlink()
+            offset = None
+
+        else:
+            raise HttpError(src, r.status, r.reason)
+
+    if offset is None:
+        return _fetch_cached(args, src, tgt)
+
+    # Drop the old metadata first so that it can never be paired with a newer
+    # file if we get interrupted
+    meta.unlink(missing_ok=True)
+    os.replace(part, data)
+    os.replace(part_meta, meta)
+
+    if r.status == 206:
+        shutil.copyfile(data, tgt)
+
+
+def download(args, src, tgt):
+    """
+    Download a single file. Transient failures (server errors, rate limiting,
+    and network errors) are retried with exponential backoff.
+    """
+
+    fetch = _fetch_cached if args.path_cache else _fetch
+
+    for attempt in range(DOWNLOAD_MAX_RETRIES):
+        if args.stop.is_set():
+            raise CancelledError()
+
+        try:
+            # Optionally keep existing files as a cheap approximation of
+            # re-validating them, so this only compares sizes
+            if args.skip_existing and _exists_with_same_size(args, src, tgt):
+                return
+
+            fetch(args, src, tgt)
+            return
+
+        except HttpError as e:
+            if not e.is_transient() or attempt == DOWNLOAD_MAX_RETRIES - 1:
+                raise
+
+        # Only retry transient network errors, not local ones like a full disk
+        except (http.client.HTTPException, ConnectionError, TimeoutError, socket.gaierror):
+            if attempt == DOWNLOAD_MAX_RETRIES - 1:
+                raise
+
+        # Returns early if we have been asked to stop
+        args.stop.wait(2 ** attempt)
+
+
+def download_all(args, downloads):
+    """Download all given (source URL, target path) pairs concurrently"""
+
+    futures = [args.download_pool.submit(download, args, src, tgt) for src, tgt in downloads]
+    wait_all(futures)
 
 
 class Patch:
+    __slots__ = ("name", "fn")
+
     def __init__(self, name, fn) -> None:
         self.name = name
         self.fn = fn
@@ -125,15 +585,28 @@ class Patch:
         self.fn(log, args)
 
 
+def run_tool(log, cmd, **kwargs):
+    """
+    Run an external tool. Its output is forwarded to the given logger, so that
+    it stays together with the output of the patch running it.
+    """
+
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+
+    for line in proc.stdout.decode(errors="replace").splitlines():
+        log.info(line)
+
+    return proc.returncode
+
+
 def patch_venus_extract(log, args):
-    pil_splitter = PATH_THIRDPARTY / "qcom-mbn-tools" / "pil-splitter.py"
     mbn_venus = args.path_out / 'qcom' / PATH_PLATFORM / 'qcvss8180.mbn'
     dir_venus = args.path_out / 'qcom' / PATH_VENUS
 
     dir_venus.mkdir(parents=True, exist_ok=True)
 
-    subprocess.call([pil_splitter, mbn_venus, dir_venus / 'venus'])
-    shutil.copy(mbn_venus, dir_venus / 'venus.mbn')
+    run_tool(log, [TOOL_PIL_SPLITTER, mbn_venus, dir_venus / 'venus'])
+    shutil.copyfile(mbn_venus, dir_venus / 'venus.mbn')
 
 
 def patch_ath10k_board(log, args):
@@ -147,9 +620,9 @@ def patch_ath10k_board(log, args):
     remote processor.
     """
 
-    ath10k_bdencoder = PATH_THIRDPARTY / "qca-swiss-army-knife" / "tools" / "scripts" / "ath10k" / "ath10k-bdencoder"
-    path_boards = args.path_out.resolve() / 'ath10k' / 'WCN3990' / 'hw1.0' / 'boards'
-    path_board_out = args.path_out.resolve() / 'ath10k' / 'WCN3990' / 'hw1.0' / 'board-2.bin'
+    path_hw = args.path_out.resolve() / 'ath10k' / 'WCN3990' / 'hw1.0'
+    path_boards = path_hw / 'boards'
+    path_board_out = path_hw / 'board-2.bin'
 
     spec = [
         {
@@ -158,12 +631,9 @@ def patch_ath10k_board(log, args):
         }
     ]
 
-    file = tempfile.NamedTemporaryFile()
-
-    with open(file.name, "w") as fd:
-        json.dump(spec, fd)
-
-    subprocess.call([ath10k_bdencoder, "-c", file.name, "-o", path_board_out])
+    # Pass the spec via stdin instead of going through a temporary file
+    data = json.dumps(spec, separators=(",", ":")).encode()
+    run_tool(log, [TOOL_ATH10K_BDENCODER, "-c", "/dev/stdin", "-o", path_board_out], input=data)
     shutil.rmtree(path_boards)
 
 
@@ -179,12 +649,11 @@ def patch_ath10k_firmware(log, args):
     See also: https://www.spinics.net/lists/linux-wireless/msg178387.html.
     """
 
-    ath10k_fwencoder = PATH_THIRDPARTY / "qca-swiss-army-knife" / "tools" / "scripts" / "ath10k" / "ath10k-fwencoder"
     fw5_bin = args.path_out / 'ath10k' / 'WCN3990' / 'hw1.0' / 'firmware-5.bin'
 
     args = ['--modify', '--features=wowlan,mgmt-tx-by-ref,non-bmi,single-chan-info-per-channel', fw5_bin]
 
-    subprocess.call([ath10k_fwencoder] + args)
+    run_tool(log, [TOOL_ATH10K_FWENCODER] + args)
 
 
 def patch_qca_bt_symlinks(log, args):
@@ -330,16 +799,83 @@ patches = [
 ]
 
 
+def wait_all(futures):
+    """
+    Wait for all futures to complete. If one of them fails or waiting gets
+    interrupted (e.g. via Ctrl-C), cancel all that have not been started yet.
+    """
+
+    try:
+        for future in futures:
+            future.result()
+
+    except BaseException:
+        for future in futures:
+            future.cancel()
+
+        raise
+
+
+def run_concurrently(log, items, fn):
+    """
+    Run fn(item, log) for all items concurrently. Each item gets its own
+    buffered logger. These are flushed as one block per item, in the order of
+    the items, so that the output reads the same as for a sequential run.
+    """
+
+    def run(item, log):
+        log.info(f"{item.name}")
+        fn(item, log.sub())
+
+    ex = ThreadPoolExecutor(max_workers=len(items))
+    logs = [log.buffered() for _ in items]
+    futures = []
+
+    try:
+        futures += [ex.submit(run, item, buf) for item, buf in zip(items, logs)]
+
+        for future, buf in zip(futures, logs):
+            try:
+                future.result()
+
+            except CancelledError:
+                # We are being stopped from the outside, so there is no point
+                # in printing the output after the fact
+                raise
+
+            except BaseException:
+                # Only show the output of the item that failed, not that of
+                # one we stopped waiting for (e.g. on Ctrl-C)
+                if future.done():
+                    buf.flush()
+                raise
+
+            buf.flush()
+
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    finally:
+        # Do not wait for the remaining items if we failed
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
 def gather(log, args, sources):
-    for src in sources:
-        log.info(f"{src.name}")
-        src.get(log.sub(), args)
+    # Sources are independent of each other, so retrieve them concurrently
+    run_concurrently(log, sources, lambda src, log: src.get(log, args))
 
 
 def patch(log, args, patches):
-    for patch in patches:
-        log.info(f"{patch.name}")
-        patch.apply(log.sub(), args)
+    # Patches operate on disjoint parts of the output tree, so apply them
+    # concurrently
+    run_concurrently(log, patches, lambda patch, log: patch.apply(log, args))
+
+
+def default_cache_directory():
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "getfw"
 
 
 def main():
@@ -350,19 +886,46 @@ def main():
     parser = argparse.ArgumentParser(description="Gather firmware files for Surface Pro X (SQ2)")
     parser.add_argument("-w", "--windows", help="Windows root directory", required=True)
     parser.add_argument("-o", "--output", help="output directory", default="out")
+    parser.add_argument("-c", "--cache", help="download cache directory", default=default_cache_directory())
+    parser.add_argument("--no-cache", help="do not use the download cache", action="store_true")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="do not download files already present in the output directory with the same size as upstream")
     cli_args = parser.parse_args()
 
     args = types.SimpleNamespace()
     args.path_wdsfr = Path(cli_args.windows) / PATH_WDSFR
+    args.wdsfr_index = sorted(p.name for p in args.path_wdsfr.iterdir())
     args.path_out = Path(cli_args.output)
+    args.path_cache = None if cli_args.no_cache else Path(cli_args.cache)
+    args.skip_existing = cli_args.skip_existing
+
+    # Set to make pending downloads and copies bail out, e.g. on Ctrl-C
+    args.stop = threading.Event()
+    args.http = HttpSession(args.stop)
+
+    if args.path_cache:
+        args.path_cache.mkdir(parents=True, exist_ok=True)
 
     log = Logger()
 
-    log.info("retrieving base firmware files")
-    gather(log.sub(), args, sources)
+    # Shared by all sources, so that the worker limits apply globally
+    args.download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_WORKERS)
+    args.copy_pool = ThreadPoolExecutor(max_workers=COPY_MAX_WORKERS)
+
+    try:
+        log.info("retrieving base firmware files")
+        gather(log.sub(), args, sources)
+
+        log.info("patching firmware files")
+        patch(log.sub(), args, patches)
+
+    except BaseException:
+        args.stop.set()
+        raise
 
-    log.info("patching firmware files")
-    patch(log.sub(), args, patches)
+    finally:
+        for pool in (args.download_pool, args.copy_pool):
+            pool.shutdown(wait=not args.stop.is_set(), cancel_futures=True)
 
     log.info("done!")
 